@@ -17,7 +17,12 @@ setup(
         "pymongo",
         "bokeh",
         "statsmodels",
+        "prometheus-client",
     ],
+    extras_require={
+        "loadtest": ["mongomock"],
+        "profiling": ["pyinstrument"],
+    },
     
     author='Daniela Komenda',
     author_email='komenda.daniela@gmail.com',
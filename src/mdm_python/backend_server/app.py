@@ -1,27 +1,34 @@
+import cProfile
+import functools
+import io
 import json
 import logging
 import os
 import pickle
+import pstats
 import sys
+import tempfile
+import time
+from pathlib import Path
 
-import bokeh.embed
-import bokeh.resources
 import dotenv
 import flask_caching
 import markupsafe
-from azure.storage.blob import BlobServiceClient
-from flask import Flask, render_template, request
+from flask import Flask, g, render_template, request
 
-import mdm_python.data_preparation.db_entsoe as db_entsoe
-import mdm_python.data_preparation.plot_historic as plot_historic
-import mdm_python.data_preparation.plot_forecast as plot_forecast
+import mdm_python.metrics as metrics
+from mdm_python.metrics import span
 
 
 logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 
+# The plotting-, Azure- and modelling-stacks (bokeh, pandas, matplotlib, statsmodels)
+# are imported on first use in the endpoints, so the app boots and serves pages fast
+
 
 app = Flask(__name__)
 cache = flask_caching.Cache(app, config={"CACHE_TYPE": "SimpleCache"})
+app.config["PROFILING"] = os.getenv("ENABLE_PROFILING") == "1"
 energy_models = None
 
 
@@ -29,41 +36,136 @@ def run() -> None:
     app.run()
 
 
+def start_profiler(kind):
+    """Start cProfile or, if requested with 'X-Profile: pyinstrument' and installed, pyinstrument"""
+    if kind == "pyinstrument":
+        try:
+            import pyinstrument
+
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            return profiler
+        except ImportError:
+            logging.warning("pyinstrument is not installed, profiling with cProfile")
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def profile_response(profiler):
+    """Stop the profiler and return its report instead of the regular response"""
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(50)
+        return app.response_class(stream.getvalue(), mimetype="text/plain")
+
+    profiler.stop()
+    return app.response_class(profiler.output_html(), mimetype="text/html")
+
+
+@app.before_request
+def start_request():
+    g.start = time.perf_counter()
+    if app.config["PROFILING"] and "X-Profile" in request.headers:
+        g.profiler = start_profiler(request.headers["X-Profile"])
+
+
+@app.after_request
+def finish_request(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        response = profile_response(profiler)
+
+    # Observed when the response is closed, so streamed bodies are included
+    endpoint = request.endpoint or "unknown"
+    start = g.start
+    response.call_on_close(
+        lambda: metrics.request_seconds.labels(endpoint).observe(time.perf_counter() - start)
+    )
+    if request.endpoint == "energy":
+        metrics.cache_lookup("energy-plots", hit=not g.get("cache_miss", False))
+
+    return response
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    data, content_type = metrics.generate_latest()
+    return app.response_class(response=data, status=200, content_type=content_type)
+
+
 @app.get("/")
 def main_page():
     return web_page("main")
 
 
+@functools.cache
+def bokeh_resources():
+    import bokeh.resources
+
+    return markupsafe.Markup(bokeh.resources.CDN.render())
+
+
 @app.route("/pages/<string:page>")
 def web_page(page):
     return render_template(
         f"{page}.html",
-        resources=markupsafe.Markup(bokeh.resources.CDN.render()),
+        resources=bokeh_resources(),
     )
 
 
 @app.get("/energy-plots")
-@cache.cached()
+@cache.cached(query_string=True)
 def energy():
+    """Historic plots as JSON, or with '?format=binary' with their column-data as binary buffers"""
+    g.cache_miss = True
     try:
+        import bokeh.embed
+
+        import mdm_python.data_preparation.db_entsoe as db_entsoe
+        import mdm_python.data_preparation.plot_historic as plot_historic
+
         data_hourly = db_entsoe.extract_hourly_energy()
         data_daily = db_entsoe.extract_daily_energy()
 
-        grouped_bar_plot = plot_historic.grouped_bar_plot(data_daily)
-        stacked_area_plot = plot_historic.stacked_area_plot(
-            data_hourly=data_hourly, data_daily=data_daily
-        )
-
-        data = json.dumps(
-            dict(
-                plot1=bokeh.embed.json_item(grouped_bar_plot),
-                plot2=bokeh.embed.json_item(stacked_area_plot),
+        with span("bokeh_plot"):
+            grouped_bar_plot = plot_historic.grouped_bar_plot(data_daily)
+            stacked_area_plot = plot_historic.stacked_area_plot(
+                data_hourly=data_hourly, data_daily=data_daily
             )
-        )
+            yearly_pie_plot = plot_historic.yearly_pie_plot(
+                plot_historic.summary_payload(data_daily)
+            )
+
+        if request.args.get("format") == "binary":
+            import mdm_python.backend_server.columnar as columnar
+
+            with span("binary_serialize"):
+                data = columnar.encode_plots(
+                    dict(
+                        plot1=grouped_bar_plot,
+                        plot2=stacked_area_plot,
+                        plot3=yearly_pie_plot,
+                    )
+                )
+            mimetype = "application/octet-stream"
+        else:
+            with span("json_serialize"):
+                data = json.dumps(
+                    dict(
+                        plot1=bokeh.embed.json_item(grouped_bar_plot),
+                        plot2=bokeh.embed.json_item(stacked_area_plot),
+                        plot3=bokeh.embed.json_item(yearly_pie_plot),
+                    )
+                )
+            mimetype = "application/json"
+
         response = app.response_class(
             response=data,
             status=200,
-            mimetype="application/json",
+            mimetype=mimetype,
         )
         return flask_caching.CachedResponse(
             response=response,
@@ -78,40 +180,73 @@ def energy():
         )
 
 
+def load_models_local(model_directory):
+    """Load the models from a local directory instead of Azure (e.g. for load-tests)"""
+    models = dict()
+    for path in sorted(Path(model_directory).glob("*.pickle")):
+        if path.name.startswith("metaparams_"):
+            continue
+        print("\t" + path.name)
+        with open(path, "rb") as fh:
+            models[path.name] = pickle.load(fh)
+
+    return models
+
+
 @cache.cached()
 def load_models():
     dotenv.load_dotenv()
-    azure_storage_connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    blob_service_client = BlobServiceClient.from_connection_string(
-        azure_storage_connection_string
-    )
+    model_directory = os.getenv("MODEL_DIRECTORY")
+    if model_directory:
+        print(f"loading from directory: {model_directory}")
+        with span("model_load", source="local"):
+            return load_models_local(model_directory)
+
+    import mdm_python.data_preparation.model_registry as model_registry
+
+    blob_service_client = model_registry.connect_to_azure()
 
-    containers = blob_service_client.list_containers(include_metadata=True)
-    suffix = 0
-    for container in containers:
-        existingContainerName = container["name"]
-        if existingContainerName.startswith("energy-model"):
-            parts = existingContainerName.split("-")
-            newSuffix = int(parts[-1])
-            if newSuffix > suffix:
-                suffix = newSuffix
+    # The manifest names the latest complete version; artifacts with a known hash come from the local cache
+    manifest = model_registry.read_latest_manifest(blob_service_client)
+    if manifest is not None:
+        print(f"loading version {manifest['version']} from container: {manifest['container']}")
+        with span("model_load", source="azure", container=manifest["container"]):
+            models = model_registry.fetch_models(
+                manifest,
+                blob_service_client,
+                os.getenv("MODEL_CACHE_DIRECTORY", Path(tempfile.gettempdir()) / "energy-model-cache"),
+            )
+        metrics.model_version.set(manifest["version"])
+        return models
 
+    # Versions published before the manifest
+    suffix = model_registry.latest_model_suffix(blob_service_client)
     container_name = f"energy-model-{suffix}"
     print(f"loading from container: {container_name}")
 
-    container_client = blob_service_client.get_container_client(container_name)
-    blob_list = container_client.list_blobs()
+    with span("model_load", source="azure", container=container_name):
+        models = model_registry.load_container_models(blob_service_client, container_name)
+    metrics.model_version.set(suffix)
 
-    models = dict()
-    for blob in blob_list:
-        print("\t" + blob.name)
-        content = container_client.download_blob(blob.name).readall()
-        model = pickle.loads(content)
-        models[blob.name]=model
-    
     return models
 
 
+def stream_forecasts(models, energy_types, forecast_horizon):
+    """Yield one JSON-line per energy-type, in the order the forecasts are ready"""
+    import mdm_python.data_preparation.plot_forecast as plot_forecast
+
+    for name, future in plot_forecast.plot_forecast_concurrently(
+        models,
+        energy_types,
+        forecast_horizon,
+    ):
+        try:
+            line = dict(type=name, plot=future.result())
+        except Exception as ex:
+            line = dict(type=name, error=repr(ex))
+        yield json.dumps(line) + "\n"
+
+
 @app.route("/energy-prediction", methods=["POST", "GET"])
 def energy_predict():
     global energy_models
@@ -120,9 +255,19 @@ def energy_predict():
         energy_types = request.json.get("types", [])
         forecast_horizon = int(request.json.get("forecastHorizon", 1))
         
+        metrics.cache_lookup("models", hit=energy_models is not None)
         if energy_models is None:
             energy_models = load_models()
 
+        if request.json.get("stream", False):
+            return app.response_class(
+                response=stream_forecasts(energy_models, energy_types, forecast_horizon),
+                status=200,
+                mimetype="application/x-ndjson",
+            )
+
+        import mdm_python.data_preparation.plot_forecast as plot_forecast
+
         plots = plot_forecast.plot_forecast(
             energy_models,
             energy_types,
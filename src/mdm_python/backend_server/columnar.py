@@ -0,0 +1,85 @@
+"""
+Binary columnar payload for Bokeh-plots
+
+The plot-specs are serialized with bokeh.embed.json_item, but without the numeric columns
+of their ColumnDataSources. These columns are appended as raw typed-array buffers:
+
+    uint32 (little-endian)  length of the JSON-header
+    JSON-header             dict(plots=..., columns=[dict(source, column, dtype, offset, length)])
+    buffers                 start at the first 8-byte boundary after the header;
+                            the offsets of the columns are relative to it and 8-byte aligned
+
+The browser embeds the plots and assigns the buffers to the sources as Float32Array,
+Float64Array or Int32Array. Datetimes are sent as float64 milliseconds since epoch, like Bokeh does.
+
+Float columns are converted to float32, which is lossy (about 7 significant digits).
+json_item already sends numpy columns as base64-encoded ndarray buffers, so the payload
+only gets smaller by dropping the base64 (4/3) and by the float32 conversion; serialization
+is not faster (see payload_benchmark).
+"""
+import json
+import struct
+
+import bokeh.embed
+import bokeh.models
+import numpy as np
+
+
+dtypes = dict(float32=np.dtype("<f4"), float64=np.dtype("<f8"), int32=np.dtype("<i4"))
+
+
+def to_typed_array(values):
+    """Return the column as little-endian typed-array, or None if it can not be sent as one"""
+    if not isinstance(values, np.ndarray):
+        return None
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64).astype(dtypes["float64"]) / 1e6
+    if values.dtype.kind == "f":
+        return values.astype(dtypes["float32"])
+    if values.dtype.kind in "iu" and (values.size == 0 or np.abs(values).max() < 2**31):
+        return values.astype(dtypes["int32"])
+    return None
+
+
+def split_columns(fig):
+    """
+    Take the columns out of the figure's ColumnDataSources; return {(source-id, column): array}
+    Sources with a column that can not be sent as typed-array stay in the JSON as a whole
+    """
+    columns = dict()
+    for source in fig.select({"type": bokeh.models.ColumnDataSource}):
+        arrays = {name: to_typed_array(values) for name, values in source.data.items()}
+        if any(array is None for array in arrays.values()):
+            continue
+        for name, array in arrays.items():
+            columns[(source.id, name)] = array
+        source.data = {name: [] for name in arrays}
+    return columns
+
+
+def encode_plots(plots):
+    """Serialize the plots (name -> figure) into one binary payload"""
+    columns = dict()
+    items = dict()
+    for name, fig in plots.items():
+        columns.update(split_columns(fig))
+        items[name] = bokeh.embed.json_item(fig)
+
+    manifest = []
+    offset = 0
+    for (source, column), array in columns.items():
+        manifest.append(dict(source=source, column=column, dtype=array.dtype.name, offset=offset, length=array.size))
+        offset += -(-array.nbytes // 8) * 8
+
+    header = json.dumps(dict(plots=items, columns=manifest)).encode("utf-8")
+
+    # The buffers start 8-byte aligned after the header, so the browser can view them without copying
+    start = -(-(4 + len(header)) // 8) * 8
+    payload = bytearray(start + offset)
+    struct.pack_into("<I", payload, 0, len(header))
+    payload[4 : 4 + len(header)] = header
+    for entry, array in zip(manifest, columns.values()):
+        entry_start = start + entry["offset"]
+        payload[entry_start : entry_start + array.nbytes] = array.tobytes()
+
+    return bytes(payload)
@@ -0,0 +1,257 @@
+"""
+Load-test the web-app against local stand-ins for MongoDB and Azure Blob
+
+    python -m mdm_python.backend_server.load_test --concurrency 8 --requests 40
+
+By default the energy data lives in an in-memory MongoDB ('mongomock://') seeded with
+synthetic data, and the models are trained on that data and loaded from a local directory.
+Every endpoint is driven twice: cold, one request after the other with all caches cleared
+before each, and then warm, with the caches filled and the given concurrency.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pandas as pd
+
+
+energy_types = ["wind", "solar", "nuclear", "water_river", "water_pump", "water_reservoir"]
+
+# Field names as they are stored by the scraper
+energy_fields = dict(
+    wind="Wind Onshore Generation",
+    solar="Solar Generation",
+    nuclear="Nuclear Generation",
+    water_reservoir="Hydro Water Reservoir Generation",
+    water_river="Hydro Run-of-river and poundage Generation",
+    water_pump="Hydro Pumped Storage Generation",
+)
+
+
+def synthetic_energy_data(days, seed=0) -> pd.DataFrame:
+    """Create hourly energy data with daily and yearly seasonality, shaped like the scraped data"""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(datetime.date.today())
+    index = pd.date_range(end=end, periods=days * 24, freq="h")
+
+    hour = index.hour.to_numpy()
+    yearly = np.sin(2 * np.pi * index.dayofyear.to_numpy() / 365.25)
+    daylight = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, None)
+    noise = lambda scale: rng.normal(0, scale, len(index))
+
+    df = pd.DataFrame(
+        dict(
+            wind=np.clip(20 - 10 * yearly + noise(8), 0, None),
+            solar=np.clip(daylight * (500 + 300 * yearly) + noise(30), 0, None),
+            nuclear=np.clip(2800 + 300 * yearly + noise(100), 0, None),
+            water_reservoir=np.clip(1000 - 400 * yearly + noise(150), 0, None),
+            water_river=np.clip(1100 + 500 * yearly + noise(80), 0, None),
+            water_pump=np.clip(300 + 200 * daylight + noise(60), 0, None),
+        ),
+        index=index.rename("datetime"),
+    )
+    return df.round(1)
+
+
+def seed_energy_data(collection, days, seed=0):
+    """Insert synthetic data into an empty collection; never touches a filled one"""
+    if collection.estimated_document_count() > 0:
+        print("collection already holds data, not seeding")
+        return
+
+    df = synthetic_energy_data(days, seed).rename(columns=energy_fields)
+    df.insert(0, "country", "10YCH-SWISSGRIDZ")
+    records = df.reset_index().to_dict("records")
+    for record in records:
+        record["datetime"] = record["datetime"].to_pydatetime()
+    collection.insert_many(records)
+    print(f"seeded {len(records)} hourly documents")
+
+
+def train_models(directory):
+    """Train the production models on the (seeded) data and store them in the directory"""
+    import mdm_python.data_preparation.db_entsoe as db_entsoe
+    import mdm_python.data_preparation.model_create as model_create
+
+    dataset = model_create.prepare_raw_data(db_entsoe.extract_daily_energy())
+    dataset = model_create.create_production_model(dataset)
+    model_create.store_locally(dataset, directory=Path(directory))
+
+
+def start_server(app):
+    """Serve the app in a background-thread on a free port; return the base-url"""
+    import werkzeug.serving
+
+    server = werkzeug.serving.make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def reset_caches(app_module):
+    """Clear the response-cache, drop the loaded models and shut the forecast-pool down"""
+    import mdm_python.data_preparation.plot_forecast as plot_forecast
+
+    app_module.cache.clear()
+    app_module.energy_models = None
+    with plot_forecast.forecast_executor_lock:
+        if plot_forecast.forecast_executor is not None:
+            plot_forecast.forecast_executor.shutdown()
+            plot_forecast.forecast_executor = None
+
+
+def request_factory(endpoint, type_mixes, horizons, rng):
+    """Return a function that creates the next request for the endpoint"""
+    if endpoint == "energy-plots":
+        return lambda: dict(method="GET", url="/energy-plots")
+
+    def prediction_request():
+        return dict(
+            method="POST",
+            url="/energy-prediction",
+            json=dict(
+                types=rng.choice(type_mixes),
+                forecastHorizon=rng.choice(horizons),
+            ),
+        )
+
+    return prediction_request
+
+
+async def drive(base_url, next_request, n_requests, concurrency):
+    """Send n_requests with at most 'concurrency' in flight; return latencies, errors and duration"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(client):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(**next_request())
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200 or "error" in response.json():
+                errors += 1
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(n_requests)))
+        duration = time.perf_counter() - start
+
+    return latencies, errors, duration
+
+
+def drive_cold(base_url, next_request, n_requests, reset):
+    """Send n_requests one after the other, each after reset(); return latencies, errors and duration"""
+    latencies = []
+    errors = 0
+
+    with httpx.Client(base_url=base_url, timeout=None) as client:
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            reset()
+            request_start = time.perf_counter()
+            response = client.request(**next_request())
+            latencies.append(time.perf_counter() - request_start)
+            if response.status_code != 200 or "error" in response.json():
+                errors += 1
+        duration = time.perf_counter() - start
+
+    return latencies, errors, duration
+
+
+def summarize(endpoint, phase, latencies, errors, duration):
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return dict(
+        endpoint=endpoint,
+        phase=phase,
+        requests=len(latencies),
+        errors=errors,
+        throughput=round(len(latencies) / duration, 2),
+        p50_ms=round(p50, 1),
+        p95_ms=round(p95, 1),
+        p99_ms=round(p99, 1),
+    )
+
+
+def parse_type_mix(value):
+    types = energy_types if value == "all" else value.split(",")
+    unknown = set(types) - set(energy_types)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown energy-types: {sorted(unknown)}")
+    return types
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", default=["energy-plots", "energy-prediction"],
+                        choices=["energy-plots", "energy-prediction"])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="warm requests per endpoint")
+    parser.add_argument("--cold-requests", type=int, default=3, help="cold requests per endpoint, each after a reset")
+    parser.add_argument("--type-mix", type=parse_type_mix, action="append", dest="type_mixes",
+                        help="comma-separated energy-types or 'all'; repeat for a random mix")
+    parser.add_argument("--horizons", type=int, nargs="+", default=[1, 10, 52], help="forecast-horizons in weeks")
+    parser.add_argument("--mongodb-uri", default="mongomock://localhost",
+                        help="'mongomock://...' for an in-memory store, or a local MongoDB to seed")
+    parser.add_argument("--model-directory", help="directory with trained models; trained on the seed-data if omitted")
+    parser.add_argument("--days", type=int, default=3 * 365, help="days of synthetic data to seed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+    args.type_mixes = args.type_mixes or [["wind"], ["solar", "nuclear"], energy_types]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Point the app at the stand-ins before it is imported
+    os.environ["MONGODB_URI"] = args.mongodb_uri
+    import mdm_python.data_preparation.db_entsoe as db_entsoe
+
+    seed_energy_data(db_entsoe.connect_to_db(), args.days, args.seed)
+
+    model_directory = args.model_directory
+    if model_directory is None:
+        model_directory = tempfile.mkdtemp(prefix="energy-models-")
+        print(f"training models into {model_directory}")
+        train_models(model_directory)
+    os.environ["MODEL_DIRECTORY"] = str(model_directory)
+
+    import mdm_python.backend_server.app as app_module
+
+    base_url = start_server(app_module.app)
+    rng = random.Random(args.seed)
+
+    results = []
+    for endpoint in args.endpoints:
+        next_request = request_factory(endpoint, args.type_mixes, args.horizons, rng)
+        latencies, errors, duration = drive_cold(
+            base_url, next_request, args.cold_requests, lambda: reset_caches(app_module)
+        )
+        results.append(summarize(endpoint, "cold", latencies, errors, duration))
+
+        # The last cold request filled the caches
+        latencies, errors, duration = asyncio.run(
+            drive(base_url, next_request, args.requests, args.concurrency)
+        )
+        results.append(summarize(endpoint, "warm", latencies, errors, duration))
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(dict(config=vars(args), results=results), fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare the JSON- and the binary columnar payload of the historic plots
+
+    python -m mdm_python.backend_server.payload_benchmark --days 1095
+
+Seeds an in-memory MongoDB with synthetic data (see load_test), builds the plots and reports
+serialization-time, decoding-time of the header and payload-size (raw and gzipped) of both paths.
+"""
+import argparse
+import gzip
+import json
+import os
+import struct
+import time
+
+import pandas as pd
+
+
+def build_plots(data_hourly, data_daily):
+    import mdm_python.data_preparation.plot_historic as plot_historic
+
+    return dict(
+        plot1=plot_historic.grouped_bar_plot(data_daily),
+        plot2=plot_historic.stacked_area_plot(data_hourly=data_hourly, data_daily=data_daily),
+        plot3=plot_historic.yearly_pie_plot(plot_historic.summary_payload(data_daily)),
+    )
+
+
+def measure(encode, decode, repeat):
+    """Return the best encoding- and decoding-time in milliseconds and the payload"""
+    encode_times = []
+    decode_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = encode()
+        encode_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decode(payload)
+        decode_times.append(time.perf_counter() - start)
+    return min(encode_times) * 1000, min(decode_times) * 1000, payload
+
+
+def decode_binary_header(payload):
+    (header_length,) = struct.unpack_from("<I", payload, 0)
+    return json.loads(payload[4 : 4 + header_length])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=3 * 365, help="days of synthetic data")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    os.environ["MONGODB_URI"] = "mongomock://localhost"
+    import bokeh.embed
+
+    import mdm_python.backend_server.columnar as columnar
+    import mdm_python.backend_server.load_test as load_test
+    import mdm_python.data_preparation.db_entsoe as db_entsoe
+
+    load_test.seed_energy_data(db_entsoe.connect_to_db(), args.days)
+    data_hourly = db_entsoe.extract_hourly_energy()
+    data_daily = db_entsoe.extract_daily_energy()
+
+    # The plots are built anew for every run, as the binary path empties their sources
+    json_encode = lambda: json.dumps(
+        {name: bokeh.embed.json_item(fig) for name, fig in build_plots(data_hourly, data_daily).items()}
+    ).encode("utf-8")
+    binary_encode = lambda: columnar.encode_plots(build_plots(data_hourly, data_daily))
+    build_ms = measure(lambda: build_plots(data_hourly, data_daily), lambda _: None, args.repeat)[0]
+
+    results = []
+    for name, encode, decode in [
+        ("json", json_encode, json.loads),
+        ("binary", binary_encode, decode_binary_header),
+    ]:
+        encode_ms, decode_ms, payload = measure(encode, decode, args.repeat)
+        results.append(
+            dict(
+                payload=name,
+                serialize_ms=round(encode_ms - build_ms, 1),
+                parse_ms=round(decode_ms, 1),
+                bytes=len(payload),
+                gzip_bytes=len(gzip.compress(payload)),
+            )
+        )
+
+    print(f"{len(data_hourly)} hourly and {len(data_daily)} daily rows, plots built in {build_ms:.1f}ms")
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Check the import-time of the web-app against a budget
+
+    python -m mdm_python.backend_server.startup_benchmark --budget 0.6
+
+Imports the app in a fresh interpreter with 'python -X importtime', reports the slowest
+top-level imports and fails, if the budget is exceeded or a heavy stack is imported at boot.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+
+# Only needed by the endpoints, never when the app boots
+heavy_modules = ["bokeh", "pandas", "matplotlib", "statsmodels", "azure", "pymongo"]
+
+
+def import_times(module):
+    """
+    Return the total import-time in seconds, the cumulative import-time of the
+    top-level imports and their direct imports, and the names of all imported modules
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total = 0
+    times = dict()
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # Nested imports are indented by two spaces
+        seconds = int(cumulative) / 1e6
+        modules.append(name.strip())
+        if depth == 0:
+            total += seconds
+        if depth <= 1:
+            times[name.strip()] = seconds
+    return total, times, modules
+
+
+def first_response_time():
+    """Seconds from importing the app until the main-page is rendered, in a fresh interpreter"""
+    code = (
+        "import time; start = time.perf_counter();"
+        "import mdm_python.backend_server.app as app;"
+        "assert app.app.test_client().get('/').status_code == 200;"
+        "print(time.perf_counter() - start)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="mdm_python.backend_server.app")
+    parser.add_argument("--budget", type=float, default=0.6, help="maximal import-time in seconds")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    total, times, modules = import_times(args.module)
+
+    print(f"Import of {args.module}: {total:.3f}s (budget {args.budget:.3f}s)")
+    for name, seconds in sorted(times.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"\t{seconds:.3f}s\t{name}")
+
+    start = time.perf_counter()
+    print(f"Import and first page: {first_response_time():.3f}s")
+    print(f"Fresh interpreter incl. startup: {time.perf_counter() - start:.3f}s")
+
+    loaded_heavy = sorted({name.split(".")[0] for name in modules} & set(heavy_modules))
+    if loaded_heavy:
+        print(f"Heavy modules imported at boot: {loaded_heavy}")
+
+    if total > args.budget or loaded_heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,3 +12,42 @@ function setActiveNavbarItem() {
     });
   }
 
+
+
+// Typed arrays by the dtype-names of the binary columnar payload
+const columnArrayTypes = {
+  float32: Float32Array,
+  float64: Float64Array,
+  int32: Int32Array,
+};
+
+function decodeColumnarPayload(buffer) {
+  // uint32 header-length, JSON-header, then the 8-byte aligned column-buffers
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const header = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength))
+  );
+  const start = Math.ceil((4 + headerLength) / 8) * 8;
+
+  const sources = {};
+  header.columns.forEach(column => {
+    sources[column.source] = sources[column.source] || {};
+    sources[column.source][column.column] = new columnArrayTypes[column.dtype](
+      buffer, start + column.offset, column.length
+    );
+  });
+
+  return {...header.plots, sources: sources};
+}
+
+function attachColumns(sources) {
+  // Assign the binary columns to the ColumnDataSources of the embedded plots
+  Bokeh.documents.forEach(doc => {
+    for (const [id, columns] of Object.entries(sources)) {
+      const source = doc.get_model_by_id(id);
+      if (source !== null) {
+        source.data = {...source.data, ...columns};
+      }
+    }
+  });
+}
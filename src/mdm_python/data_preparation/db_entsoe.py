@@ -1,9 +1,12 @@
+import functools
 import os
 
 import dotenv
 import pandas as pd
 import pymongo
 
+from mdm_python.metrics import span
+
 
 def connect_to_db():
     """Open the connection to the DB and return the collection
@@ -13,13 +16,25 @@ def connect_to_db():
 
     # Get MongoDB-URI
     mongodb_uri = os.getenv("MONGODB_URI")
-    DBclient = pymongo.MongoClient(mongodb_uri)
+    DBclient = mongo_client(mongodb_uri)
     db = DBclient["MDM-Python-MeinProjekt"]
 
     return db["Energie"]
 
 
-def extract_daily_energy():
+@functools.lru_cache
+def mongo_client(mongodb_uri):
+    """Return one shared client per URI
+    URIs starting with 'mongomock://' are served by an in-memory stand-in (e.g. for load-tests)"""
+    if mongodb_uri is not None and mongodb_uri.startswith("mongomock://"):
+        import mongomock
+
+        return mongomock.MongoClient()
+    return pymongo.MongoClient(mongodb_uri)
+
+
+def extract_daily_energy(start=None):
+    """Daily averages per energy-type; only from the start-date on, if given"""
     collection = connect_to_db()
 
     pipeline = [
@@ -36,16 +51,22 @@ def extract_daily_energy():
             }
         },
     ]
-
-    results = []
-    for x in collection.aggregate(pipeline):
-        results.append(x)
-
-    df = pd.DataFrame(results)
-    df = df.set_index(("_id"))
-    df = df.set_index(pd.to_datetime(df.index).rename("date").tz_localize("UTC"))
-    df = df.sort_index()
-    df["total"] = df.sum(axis="columns")
+    if start is not None:
+        # Stored as UTC-dates; compare with a naive UTC-datetime
+        start = pd.Timestamp(start).tz_localize(None).to_pydatetime()
+        pipeline.insert(0, {"$match": {"datetime": {"$gte": start}}})
+
+    with span("db_query", query="daily"):
+        results = []
+        for x in collection.aggregate(pipeline):
+            results.append(x)
+
+    with span("aggregation", query="daily"):
+        df = pd.DataFrame(results)
+        df = df.set_index(("_id"))
+        df = df.set_index(pd.to_datetime(df.index).rename("date").tz_localize("UTC"))
+        df = df.sort_index()
+        df["total"] = df.sum(axis="columns")
 
     return df
 
@@ -64,12 +85,14 @@ def extract_hourly_energy():
         "water_pump": "$Hydro Pumped Storage Generation",
     }
 
-    results = collection.find(projection=projection)
+    with span("db_query", query="hourly"):
+        results = list(collection.aggregate([{"$project": projection}]))
 
-    df = pd.DataFrame(results)
-    df = df.set_index("datetime")
-    df = df.set_index(pd.to_datetime(df.index))
-    df = df.sort_index()
-    df["total"] = df.sum(axis="columns")
+    with span("aggregation", query="hourly"):
+        df = pd.DataFrame(results)
+        df = df.set_index("datetime")
+        df = df.set_index(pd.to_datetime(df.index))
+        df = df.sort_index()
+        df["total"] = df.sum(axis="columns")
 
     return df
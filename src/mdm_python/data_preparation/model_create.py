@@ -1,18 +1,29 @@
 from pathlib import Path
 from types import SimpleNamespace
+import argparse
 import pickle
-import os
-import dotenv
+import time
 
-from azure.storage.blob import BlobServiceClient
 import pandas as pd
 import numpy as np
 import statsmodels
 import statsmodels.api
 
 import mdm_python.data_preparation.db_entsoe as db_entsoe
+import mdm_python.data_preparation.model_registry as model_registry
 
 model_directory = Path("./data/models").resolve()
+feature_directory = Path("./data/features").resolve()
+model_cache_directory = Path("./data/model-cache").resolve()
+
+# Offset of the log-transform per energy-type; types without offset are not transformed
+offset = dict(
+    wind = 1.4,
+    solar = 6,
+    water_reservoir = 900,
+    water_river = 150,
+    water_pump = 700
+)
 
 
 def load_metaparams_local():
@@ -25,23 +36,19 @@ def load_metaparams_local():
     return metaparams
 
 
-def prepare_raw_data(data: pd.DataFrame) -> dict:
+def transform_weekly(data: pd.DataFrame) -> pd.DataFrame:
     """
     Transform the data to log-scale with an offset to handle the high number of zeros
     The offset will change the skew-of the histogram close to 0
+    Every week only depends on its own days, so weeks can be computed independently
     """
     data = data.drop(columns="total")
-    
-    offset = dict(
-        wind = 1.4,
-        solar = 6,
-        water_reservoir = 900,
-        water_river = 150,
-        water_pump = 700
-    )
+
     data_transformed = data.apply(lambda col: np.log10(col+offset[col.name]) if col.name in offset else col)
-    data_transformed = data_transformed.resample("W").mean()
-    
+    return data_transformed.resample("W").mean()
+
+
+def fill_weekly(data_transformed: pd.DataFrame) -> pd.DataFrame:
     """
     Create new DataFrame with the missing days in the index and NaN-Values
     Fill NaN-Values with the average between the previous and the next value
@@ -51,7 +58,10 @@ def prepare_raw_data(data: pd.DataFrame) -> dict:
     data_fixed = data_fixed.interpolate(method='linear')
     data_fixed = data_fixed.dropna()
     assert data_fixed.index.freq is not None, "Data must still be fixed-frequency"
+    return data_fixed
 
+
+def to_dataset(data_fixed: pd.DataFrame) -> dict:
     dict_of_transformed_data = dict()
 
     for col_name in data_fixed.columns:
@@ -65,100 +75,234 @@ def prepare_raw_data(data: pd.DataFrame) -> dict:
     return dict_of_transformed_data
 
 
-def create_production_model(dataset):
+def prepare_raw_data(data: pd.DataFrame) -> dict:
+    """Prepare the training data from the full daily history"""
+    return to_dataset(fill_weekly(transform_weekly(data)))
+
+
+def load_feature_store(directory=feature_directory):
+    """Return the stored weekly features or None, if there are none yet"""
+    path = directory / "weekly_features.pickle"
+    if not path.exists():
+        return None
+    with open(path, "rb") as fh:
+        return pickle.load(fh)
+
+
+def store_feature_store(store, directory=feature_directory):
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "weekly_features.pickle", "wb") as fh:
+        pickle.dump(store, fh)
+    print(f"Weekly features up to {store.last_date:%Y-%m-%d} are stored")
+
+
+def update_feature_store(store=None, lookback_days=7):
+    """
+    Append the weekly features of the new daily rollups to the store
+    The weeks from the last stored day minus the lookback on are recomputed,
+    so partial weeks and late scraped days are picked up; older weeks are kept
+    Without a store (or with changed offsets), all weeks are computed
+    """
+    if store is None or store.offset != offset:
+        data_daily = db_entsoe.extract_daily_energy()
+        weekly = transform_weekly(data_daily)
+    else:
+        delta_start = (store.last_date - pd.Timedelta(days=lookback_days)).normalize()
+        delta_start -= pd.Timedelta(days=delta_start.dayofweek)  # Start of the week (Monday)
+
+        data_daily = db_entsoe.extract_daily_energy(start=delta_start)
+        kept = store.weekly[store.weekly.index < delta_start]
+        weekly = pd.concat([kept, transform_weekly(data_daily)[kept.columns]])
+        print(f"Recomputed {len(weekly) - len(kept)} of {len(weekly)} weeks")
+
+    return SimpleNamespace(
+        offset = dict(offset),
+        weekly = weekly,
+        last_date = data_daily.index[-1],
+    )
+
+
+def validate_feature_store(store) -> bool:
+    """Compare the incrementally built features with a full recompute"""
+    full = fill_weekly(transform_weekly(db_entsoe.extract_daily_energy()))
+    incremental = fill_weekly(store.weekly)
+
+    valid = full.index.equals(incremental.index) and np.allclose(
+        full, incremental[full.columns], rtol=1e-9, atol=1e-12
+    )
+    print(f"Incremental weekly features {'match' if valid else 'DO NOT match'} the full recompute")
+    return valid
+
+
+def build_model(series, params):
+    return statsmodels.api.tsa.statespace.SARIMAX(
+        series,
+        trend=params["trend"],
+        order=(params["p"], params["d"], params["q"]),
+        seasonal_order=(1,1,0,52),
+    )
+
+
+def fit_model(model, start_params=None, maxiter=50):
+    """Fit the model; return the fitted model and the fit-time in seconds"""
+    start = time.perf_counter()
+    fitted = model.fit(
+        start_params=start_params,
+        maxiter=maxiter,
+        disp=False,
+        cov_type='none',
+        full_output=True,
+        low_memory=True
+    )
+    return fitted, time.perf_counter() - start
+
+
+def previous_start_params(model, previous):
+    """Fitted parameters of the previous model, if it has the same parameters as the new one"""
+    if previous is None:
+        return None
+    previous_model = previous.production_model
+    if list(previous_model.model.param_names) != list(model.param_names):
+        return None
+    return np.asarray(previous_model.params)
+
+
+def warm_fit_status(fitted, maxiter):
+    """'warm', 'warm (iteration cap)' or 'warm (not converged)'; a missing convergence-info counts as converged"""
+    retvals = fitted.mle_retvals or dict()
+    if retvals.get("converged", True):
+        return "warm"
+    # lbfgs reports the exhausted iteration-budget with warnflag 1
+    if retvals.get("warnflag") == 1 or retvals.get("iterations", 0) >= maxiter:
+        return "warm (iteration cap)"
+    return "warm (not converged)"
+
+
+def create_production_model(dataset, previous_models=None, maxiter=None, compare_cold=False, llf_tolerance=0.01):
     """
     Load the stored Meta-Parameters
     Calculate the model with the actual data
     Return production model
+
+    With previous models, the fit starts from their parameters (warm start), optionally
+    with at most maxiter iterations. Only the log-likelihood decides, whether the warm fit
+    degraded: if its log-likelihood per observation is more than llf_tolerance below the
+    reference, it falls back to a cold fit. The reference is the cold fit with compare_cold,
+    else the parameters of the previous model evaluated on the new data.
+    Not converging or hitting the iteration cap is only reported
     """
     metaparams = load_metaparams_local()
+    previous_models = previous_models or dict()
     
     for name, values in dataset.items():
         series = values.transformed_values
         params = metaparams[name]
-        values.production_model = statsmodels.api.tsa.statespace.SARIMAX(
-            series,
-            trend=params["trend"],
-            order=(params["p"], params["d"], params["q"]),
-            seasonal_order=(1,1,0,52),
-        ).fit(
-            disp=False,
-            cov_type='none',
-            full_output=False,
-            low_memory=True
-        )
-        
-        print(f"{name} is done")
+        model = build_model(series, params)
+
+        previous = previous_models.get(name)
+        start_params = previous_start_params(model, previous)
+
+        if start_params is None:
+            fitted, seconds = fit_model(model)
+            values.fit_report = dict(mode="cold", seconds=seconds, llf=fitted.llf)
+        else:
+            budget = maxiter or 50
+            fitted, seconds = fit_model(model, start_params, maxiter=budget)
+            mode = warm_fit_status(fitted, budget)
+            if mode == "warm (not converged)":
+                print(f"{name}: warning, the warm fit did not converge (llf={fitted.llf:.2f})")
+            values.fit_report = dict(mode=mode, seconds=seconds, llf=fitted.llf)
+
+            if compare_cold:
+                cold, cold_seconds = fit_model(model)
+                values.fit_report.update(cold_seconds=cold_seconds, cold_llf=cold.llf)
+                print(f"{name}: {mode} fit in {seconds:.1f}s, llf={fitted.llf:.2f}; cold fit in {cold_seconds:.1f}s, llf={cold.llf:.2f}")
+                reference_llf = cold.llf / cold.nobs
+            else:
+                # The previous parameters evaluated on the new data; the old llf is from another sample
+                reference_llf = model.loglike(start_params) / model.nobs
+                values.fit_report.update(start_llf=reference_llf * model.nobs)
+
+            if fitted.llf / model.nobs < reference_llf - llf_tolerance:
+                print(f"{name}: warm fit degraded (llf={fitted.llf:.2f}), falling back to a cold fit")
+                fitted, seconds = (cold, cold_seconds) if compare_cold else fit_model(model)
+                values.fit_report.update(mode="cold (fallback)", seconds=seconds, llf=fitted.llf)
+
+        values.production_model = fitted
+        report = values.fit_report
+        print(f"{name} is done: {report['mode']} fit in {report['seconds']:.1f}s, llf={report['llf']:.2f}")
+
     return dataset
 
 
-def store_locally(dataset):
+def load_previous_models(source, directory=model_directory):
+    """Load the previous models by energy-type from the local model-directory or the latest Azure-container"""
+    models = dict()
+    if source == "local":
+        for path in directory.glob("*.pickle"):
+            if not path.name.startswith("metaparams_"):
+                with open(path, "rb") as fh:
+                    models[path.stem] = pickle.load(fh)
+        return models
+
+    blob_service_client = model_registry.connect_to_azure()
+    manifest = model_registry.read_latest_manifest(blob_service_client)
+    if manifest is not None:
+        container_name = manifest["container"]
+        fetched = model_registry.fetch_models(manifest, blob_service_client, model_cache_directory)
+    else:
+        # Versions published before the manifest
+        container_name = f"energy-model-{model_registry.latest_model_suffix(blob_service_client)}"
+        fetched = model_registry.load_container_models(blob_service_client, container_name)
+    for blob_name, model in fetched.items():
+        models[Path(blob_name).stem] = model
+    print(f"Previous models loaded from container {container_name}")
+    return models
+
+
+def store_locally(dataset, directory=model_directory):
     for name, values in dataset.items():
-        model_directory.mkdir(parents=True, exist_ok=True)
-        with open(model_directory/f"{name}.pickle", "wb") as fh:
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory/f"{name}.pickle", "wb") as fh:
             pickle.dump(values, fh)
             print(f'Model for {name} is stored')
 
 
-def store_to_azure():
+def store_to_azure(dataset):
+    """Publish the stored models with a manifest of their hashes and the training-data range"""
+    files = {name: model_directory / f"{name}.pickle" for name in dataset}
+    index = next(iter(dataset.values())).transformed_values.index
 
-    dotenv.load_dotenv()
-    azure_storage_connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    blob_service_client = BlobServiceClient.from_connection_string(
-        azure_storage_connection_string
+    return model_registry.publish_models(
+        files,
+        training_start=index[0],
+        training_end=index[-1],
     )
 
-    """
-    Create new Container with latest Suffix
-    """
-    exists = False
-    containers = blob_service_client.list_containers(include_metadata=True)
-    suffix = 0
-    for container in containers:
-        existingContainerName = container["name"]
-        if existingContainerName.startswith("energy-model"):
-            parts = existingContainerName.split("-")
-            newSuffix = int(parts[-1])
-            if newSuffix > suffix:
-                suffix = newSuffix
-    suffix += 1
-    container_name = f"energy-model-{suffix}"
-    print("new container name: ")
-    print(container_name)
-    
-    for container in containers:
-        print("\t" + container["name"])
-        if container_name in container["name"]:
-            print("EXISTIERTT BEREITS!")
-            exists = True
-    if not exists:
-        container_client = blob_service_client.create_container(container_name)
 
-    
-    models = dict(
-        nuclear_model=model_directory / "nuclear.pickle",
-        solar_model=model_directory / "solar.pickle",
-        water_pump_model=model_directory / "water_pump.pickle",
-        water_reservoir_model=model_directory / "water_reservoir.pickle",
-        water_river_model=model_directory / "water_river.pickle",
-        wind_model=model_directory / "wind.pickle",
-    )
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the production models and store them to Azure")
+    parser.add_argument("--full-recompute", action="store_true", help="ignore the stored weekly features")
+    parser.add_argument("--validate", action="store_true", help="compare the stored weekly features with a full recompute")
+    parser.add_argument("--warm-start", choices=["local", "azure"], help="start the fit from the parameters of the previous models")
+    parser.add_argument("--maxiter", type=int, help="iteration budget of the warm fit")
+    parser.add_argument("--compare-cold", action="store_true", help="also fit cold and report fit-time and log-likelihood of both")
+    args = parser.parse_args()
 
-    for model, file_path in models.items():
-        # Create a blob client using the local file name as the name for the blob
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name, blob=file_path
-        )
-        print(f"\nUploading to Azure Storage as blob:\n\t{file_path}")
-    
-        # Upload the created file
-        with open(file=file_path, mode="rb") as data:
-            blob_client.upload_blob(data)
+    store = None if args.full_recompute else load_feature_store()
+    store = update_feature_store(store)
+    if args.validate and not validate_feature_store(store):
+        store = update_feature_store(None)
+    store_feature_store(store)
 
+    previous_models = load_previous_models(args.warm_start) if args.warm_start else None
 
-if __name__ == "__main__":
-    energy_data = db_entsoe.extract_daily_energy()
-    dataset = prepare_raw_data(energy_data)
-    dataset = create_production_model(dataset)
+    dataset = to_dataset(fill_weekly(store.weekly))
+    dataset = create_production_model(
+        dataset,
+        previous_models=previous_models,
+        maxiter=args.maxiter,
+        compare_cold=args.compare_cold,
+    )
     store_locally(dataset)
-    store_to_azure()
+    store_to_azure(dataset)
@@ -0,0 +1,168 @@
+"""
+Publish the energy-models to Azure Blob and resolve the latest version through a manifest
+
+Every version lives in its own container 'energy-model-N'. After all artifacts of a version
+are uploaded, its manifest (version, types, sizes, hashes, training-data range) is written
+to 'energy-manifest/latest.json'. This write is the commit: readers only see a version once
+it is complete, and find it without listing the containers. The copy of the manifest in the
+container is written afterwards, so a container with a manifest.json is always published.
+"""
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import dotenv
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient
+
+
+manifest_container = "energy-manifest"
+manifest_blob = "latest.json"
+
+
+def connect_to_azure():
+    dotenv.load_dotenv()
+    azure_storage_connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    return BlobServiceClient.from_connection_string(
+        azure_storage_connection_string
+    )
+
+
+def latest_model_suffix(blob_service_client):
+    """Return the highest N of the 'energy-model-N' containers (0 if there is none)"""
+    containers = blob_service_client.list_containers(include_metadata=True)
+    suffix = 0
+    for container in containers:
+        existingContainerName = container["name"]
+        if existingContainerName.startswith("energy-model"):
+            parts = existingContainerName.split("-")
+            newSuffix = int(parts[-1])
+            if newSuffix > suffix:
+                suffix = newSuffix
+    return suffix
+
+
+def sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def create_container(blob_service_client, container_name):
+    """Create the container or reuse it, unless it holds a published version (its manifest.json)"""
+    try:
+        return blob_service_client.create_container(container_name)
+    except ResourceExistsError:
+        container_client = blob_service_client.get_container_client(container_name)
+        if container_client.get_blob_client("manifest.json").exists():
+            raise ResourceExistsError(f"Container {container_name} holds a published version already")
+        print(f"Container {container_name} exists already")
+        return container_client
+
+
+def next_model_suffix(blob_service_client):
+    """Return the version after the latest manifest; scan the containers only if none was published with one"""
+    manifest = read_latest_manifest(blob_service_client)
+    if manifest is not None:
+        return manifest["version"] + 1
+    return latest_model_suffix(blob_service_client) + 1
+
+
+def publish_models(files: dict, training_start, training_end, blob_service_client=None, max_workers=6):
+    """
+    Upload the model-files (energy-type -> path) concurrently into a new version-container
+    Write the manifest last; return it
+    """
+    blob_service_client = blob_service_client or connect_to_azure()
+
+    suffix = next_model_suffix(blob_service_client)
+    container_name = f"energy-model-{suffix}"
+    print(f"new container name: {container_name}")
+    container_client = create_container(blob_service_client, container_name)
+
+    def upload(energy_type, file_path):
+        content = Path(file_path).read_bytes()
+        blob_name = Path(file_path).name
+        container_client.upload_blob(blob_name, content, overwrite=True)
+        print(f"Uploaded {blob_name} to {container_name}")
+        return energy_type, dict(blob=blob_name, size=len(content), sha256=sha256(content))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        artifacts = dict(executor.map(lambda item: upload(*item), files.items()))
+
+    manifest = dict(
+        version=suffix,
+        container=container_name,
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        types=sorted(artifacts),
+        artifacts=artifacts,
+        training_data=dict(start=str(training_start), end=str(training_end)),
+    )
+    content = json.dumps(manifest, indent=2).encode("utf-8")
+
+    # Commit: the pointer to the latest version, then the record of the version in its container
+    create_container(blob_service_client, manifest_container)
+    blob_service_client.get_blob_client(manifest_container, manifest_blob).upload_blob(content, overwrite=True)
+    container_client.upload_blob("manifest.json", content, overwrite=True)
+    print(f"Published version {suffix}")
+
+    return manifest
+
+
+def read_latest_manifest(blob_service_client):
+    """Return the manifest of the latest version, or None if no version was published with a manifest"""
+    try:
+        content = blob_service_client.get_blob_client(manifest_container, manifest_blob).download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(content)
+
+
+def load_container_models(blob_service_client, container_name):
+    """
+    Load the models of a version published before the manifest by blob-name
+    Only the pickles are loaded, not the manifest.json of an aborted publish
+    """
+    container_client = blob_service_client.get_container_client(container_name)
+    models = dict()
+    for blob in container_client.list_blobs():
+        if not blob.name.endswith(".pickle"):
+            continue
+        print("\t" + blob.name)
+        content = container_client.download_blob(blob.name).readall()
+        models[Path(blob.name).name] = pickle.loads(content)
+    return models
+
+
+def fetch_models(manifest, blob_service_client, cache_directory, max_workers=6):
+    """
+    Load the models of the manifest by blob-name, concurrently
+    Artifacts are cached locally by their hash, so unchanged models are not downloaded again;
+    every downloaded artifact is verified against the manifest
+    """
+    container_client = blob_service_client.get_container_client(manifest["container"])
+    cache_directory = Path(cache_directory)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+
+    def fetch(artifact):
+        path = cache_directory / f"{artifact['sha256']}.pickle"
+        content = path.read_bytes() if path.exists() else None
+
+        if content is None or sha256(content) != artifact["sha256"]:
+            content = container_client.download_blob(artifact["blob"]).readall()
+            if sha256(content) != artifact["sha256"]:
+                raise ValueError(f"Checksum mismatch for {artifact['blob']} in {manifest['container']}")
+            temporary_path = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+            temporary_path.write_bytes(content)
+            temporary_path.replace(path)
+            print(f"\t{artifact['blob']} downloaded")
+        else:
+            print(f"\t{artifact['blob']} from local cache")
+
+        return artifact["blob"], pickle.loads(content)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(fetch, manifest["artifacts"].values()))
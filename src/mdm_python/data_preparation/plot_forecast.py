@@ -1,13 +1,22 @@
 import base64
+import concurrent.futures
+import multiprocessing
+import os
+import threading
 from io import BytesIO
 from pathlib import Path
 
 import pandas as pd
 from matplotlib.figure import Figure
 
+from mdm_python.metrics import span
+
 
 plot_directory = Path("../src/mdm_python/backend_server/static/pictures").resolve()
 
+forecast_executor = None
+forecast_executor_lock = threading.Lock()
+
 
 def plot_forecast(models:dict, energy_types:list, forecast_horizon:int):
     """
@@ -16,30 +25,94 @@ def plot_forecast(models:dict, energy_types:list, forecast_horizon:int):
     Plot the untransformed data
     """
     plots = dict()
-    forecast_dataset = dict()
 
     for name in energy_types:
-        forecast_dataset[name] = models[f"{name.lower()}.pickle"]
+        plots[name] = plot_forecast_type(models, name, forecast_horizon)
+
+    return plots
+
 
-    for name, values in forecast_dataset.items():
-        series = values.transformed_values
+def forecast_workers():
+    """
+    FORECAST_WORKERS, else one per energy-type up to the CPUs available to the process
+    (os.cpu_count() reports the CPUs of the host inside a container)
+    """
+    if os.getenv("FORECAST_WORKERS"):
+        return int(os.getenv("FORECAST_WORKERS"))
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    return min(6, cpus)
+
+
+def get_forecast_executor(broken=None):
+    """
+    Process-Pool shared by all requests, as forecasting and plotting are CPU-bound
+    Spawned instead of forked, as the web-server runs threads; started by the first streamed request
+    Pass a broken pool to replace it; concurrent requests replace it only once
+    """
+    global forecast_executor
+    with forecast_executor_lock:
+        if forecast_executor is None or forecast_executor is broken:
+            if broken is not None:
+                broken.shutdown(wait=False)
+            forecast_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=forecast_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return forecast_executor
+
+
+def plot_forecast_concurrently(models:dict, energy_types:list, forecast_horizon:int):
+    """
+    Compute the energy-types concurrently; every task only gets the model of its type
+    Yield the name and the finished future of every type, as soon as it is ready
+    A type whose worker died (e.g. out of memory) is retried once on a new pool
+    """
+    def submit(name):
+        key = f"{name.lower()}.pickle"
+        type_models = {key: models[key]} if key in models else dict()
+        executor = get_forecast_executor()
+        try:
+            return executor.submit(plot_forecast_type, type_models, name, forecast_horizon)
+        except concurrent.futures.process.BrokenProcessPool:
+            return get_forecast_executor(broken=executor).submit(plot_forecast_type, type_models, name, forecast_horizon)
+
+    futures = {submit(name): name for name in energy_types}
+    retried = set()
+
+    while futures:
+        done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            name = futures.pop(future)
+            if isinstance(future.exception(), concurrent.futures.process.BrokenProcessPool) and name not in retried:
+                retried.add(name)
+                futures[submit(name)] = name
+            else:
+                yield name, future
+
+
+def plot_forecast_type(models:dict, name:str, forecast_horizon:int):
+    """Compute and plot the prediction of one energy-type; return the plot as data-URL"""
+    values = models[f"{name.lower()}.pickle"]
+    series = values.transformed_values
+    with span("forecast", type=name, horizon=forecast_horizon):
         forecast = values.production_model.apply(series).get_forecast(
             steps=forecast_horizon
         )
         forecast_ci = forecast.conf_int()
 
-        current = series.iloc[-1:]
+    current = series.iloc[-1:]
 
-        df = pd.DataFrame(
-            dict(
-                mean=pd.concat([current, forecast.predicted_mean]),
-                low=pd.concat([current, forecast_ci.iloc[:, 0]]),
-                high=pd.concat([current, forecast_ci.iloc[:, 1]]),
-            )
+    df = pd.DataFrame(
+        dict(
+            mean=pd.concat([current, forecast.predicted_mean]),
+            low=pd.concat([current, forecast_ci.iloc[:, 0]]),
+            high=pd.concat([current, forecast_ci.iloc[:, 1]]),
         )
+    )
 
-        untransform = lambda x: x if values.offset is None else 10**x - values.offset
+    untransform = lambda x: x if values.offset is None else 10**x - values.offset
 
+    with span("render", type=name):
         # Graph
         fig = Figure(figsize=(10, 6))
         ax = fig.subplots()
@@ -65,6 +138,4 @@ def plot_forecast(models:dict, energy_types:list, forecast_horizon:int):
         fig.savefig(buf, format="png", bbox_inches="tight")
         data = base64.b64encode(buf.getbuffer()).decode("ascii")
 
-        plots[name] = f"data:image/png;base64,{data}"
-
-    return plots
+    return f"data:image/png;base64,{data}"
@@ -1,6 +1,5 @@
 import math
 
-import pandas as pd
 import bokeh.transform
 import bokeh.models
 import bokeh.plotting
@@ -56,56 +55,85 @@ def grouped_bar_plot(data_daily):
     return fig
 
 
-def yearly_pie_plot(data_daily):
-    """Create Pie-Plot for every year"""
+def yearly_summary(data_daily):
+    """Production by year and energy-type in GWh, computed with one groupby"""
+    return round(data_daily.iloc[:, :-1].groupby(data_daily.index.year).sum() / 1000, 2)
 
-    # Create Set of years
-    years = set(data_daily.index.year)
 
-    # Create List of years, to sort it
-    years_sorted = []
-    for year in years:
-        years_sorted.append(year)
-    years_sorted.sort()
+def summary_payload(data_daily):
+    """Energy-mix of all years in one JSON-serializable dict"""
+    yearly = yearly_summary(data_daily)
 
-    for year in years_sorted:
+    return dict(
+        types=yearly.columns.to_list(),
+        yearly={str(year): row.to_list() for year, row in yearly.iterrows()},
+    )
 
-        yearly_results = data_daily[data_daily.index.year == year]
 
-        x = round(yearly_results.iloc[:, :-1].sum() / 1000, 2)
+def yearly_pie_plot(summary):
+    """Create one Pie-Plot with a year-selector from the summary_payload
+    The energy-mix of all years is embedded, so switching the year needs no request"""
 
-        data = (
-            pd.Series(x).reset_index(name="value").rename(columns={"index": "country"})
-        )
-        data["angle"] = data["value"] / data["value"].sum() * 2 * math.pi
-        data["color"] = "#BBBBBB #F0E442 #D55E00 #009E73 #0072B2 #56B4E9".split()
-
-        pie_plot = bokeh.plotting.figure(
-            height=350,
-            title=f"Yearly Production by Energy-Type in GWh in {year}",
-            toolbar_location=None,
-            tools="hover",
-            tooltips="@country: @value",
-            x_range=(-0.5, 1.0),
-        )
+    years = list(summary["yearly"])
+    colors = "#BBBBBB #F0E442 #D55E00 #009E73 #0072B2 #56B4E9".split()
 
-        pie_plot.wedge(
-            x=0,
-            y=1,
-            radius=0.4,
-            start_angle=bokeh.transform.cumsum("angle", include_zero=True),
-            end_angle=bokeh.transform.cumsum("angle"),
-            line_color="white",
-            fill_color="color",
-            legend_field="country",
-            source=data,
+    values = summary["yearly"][years[-1]]
+    source = bokeh.models.ColumnDataSource(
+        data=dict(
+            country=summary["types"],
+            value=values,
+            angle=[value / sum(values) * 2 * math.pi for value in values],
+            color=colors,
         )
+    )
+
+    pie_plot = bokeh.plotting.figure(
+        height=350,
+        title=f"Yearly Production by Energy-Type in GWh in {years[-1]}",
+        toolbar_location=None,
+        tools="hover",
+        tooltips="@country: @value",
+        x_range=(-0.5, 1.0),
+    )
+
+    pie_plot.wedge(
+        x=0,
+        y=1,
+        radius=0.4,
+        start_angle=bokeh.transform.cumsum("angle", include_zero=True),
+        end_angle=bokeh.transform.cumsum("angle"),
+        line_color="white",
+        fill_color="color",
+        legend_field="country",
+        source=source,
+    )
+
+    pie_plot.axis.axis_label = None
+    pie_plot.axis.visible = False
+    pie_plot.grid.grid_line_color = None
 
-        pie_plot.axis.axis_label = None
-        pie_plot.axis.visible = False
-        pie_plot.grid.grid_line_color = None
+    # Year-Selector
+    # to switch the data of the pie in the browser
+    year_selector = bokeh.models.Select(title="Jahr", value=years[-1], options=years)
+    year_selector.js_on_change(
+        "value",
+        bokeh.models.CustomJS(
+            args=dict(
+                select=year_selector,
+                source=source,
+                plot=pie_plot,
+                yearly=summary["yearly"],
+            ),
+            code="""
+        const values = yearly[select.value]
+        const total = values.reduce((a, b) => a + b, 0)
+        source.data = {...source.data, value: values, angle: values.map(v => v / total * 2 * Math.PI)}
+        plot.title.text = `Yearly Production by Energy-Type in GWh in ${select.value}`
+    """,
+        ),
+    )
 
-        fig = bokeh.layouts.column(pie_plot)
+    fig = bokeh.layouts.column(year_selector, pie_plot)
 
     return fig
 
@@ -3,12 +3,17 @@ import datetime
 import os
 import re
 import json
+import time
 
 import dotenv
 import pymongo
 import httpx
 import bs4
 import pandas as pd
+import prometheus_client
+
+import mdm_python.metrics as metrics
+from mdm_python.metrics import span
 
 
 def connect_to_db():
@@ -131,11 +136,13 @@ async def scraping():
     for d in date:
         try:
             print(f"Working on {d.year}-{d.month}-{d.day}")
-            df = await scrape_website_data(country=country, date=d)
+            with span("scrape", date=f"{d:%Y-%m-%d}"):
+                df = await scrape_website_data(country=country, date=d)
             collected_dfs.append(df)
+            metrics.scraper_days.labels("ok").inc()
         except Exception as ex:
             print(f"Problem with {d.year}-{d.month}-{d.day}")
-            pass
+            metrics.scraper_days.labels("failed").inc()
 
     df_to_insert = pd.concat(collected_dfs)
 
@@ -150,7 +157,9 @@ async def inserting(df_to_insert):
     collection = connect_to_db()
 
     try:
-        insert_data_to_db(collection, df_to_insert)
+        with span("db_insert", documents=df_to_insert.shape[0]):
+            insert_data_to_db(collection, df_to_insert)
+        metrics.scraper_documents.labels("inserted").inc(df_to_insert.shape[0])
     except pymongo.errors.BulkWriteError as ex:
         result = dict(ex.details)
         write_errors = result.pop("writeErrors", [])
@@ -160,6 +169,8 @@ async def inserting(df_to_insert):
         n_duplicate = len(write_errors)
         ok = ok and (n_success + n_duplicate) == df_to_insert.shape[0]
         if ok:
+            metrics.scraper_documents.labels("inserted").inc(n_success)
+            metrics.scraper_documents.labels("duplicate").inc(n_duplicate)
             print(
                 f"Discarded {n_duplicate} inserts due to duplicate keys, inserted {n_success} documents."
             )
@@ -172,8 +183,16 @@ async def inserting(df_to_insert):
 
 
 async def main():
+    start = time.perf_counter()
     df = await scraping()
     await inserting(df)
+    duration = time.perf_counter() - start
+    print(f"Scraped and stored {df.shape[0]} documents in {duration:.1f}s ({df.shape[0] / duration:.1f} documents/s)")
+
+    # Export the scraper-metrics for a Prometheus textfile-collector
+    metrics_file = os.getenv("SCRAPER_METRICS_FILE")
+    if metrics_file:
+        prometheus_client.write_to_textfile(metrics_file, prometheus_client.REGISTRY)
 
 
 if __name__ == "__main__":
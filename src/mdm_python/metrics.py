@@ -0,0 +1,67 @@
+"""
+Timing-spans and Prometheus-metrics shared by the web-app, the data-preparation and the scraper
+"""
+import contextlib
+import json
+import logging
+import time
+
+import prometheus_client
+
+
+logger = logging.getLogger("mdm_python.spans")
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+span_seconds = prometheus_client.Histogram(
+    "mdm_span_seconds",
+    "Duration of the instrumented hot-path spans",
+    ["span"],
+    buckets=latency_buckets,
+)
+request_seconds = prometheus_client.Histogram(
+    "mdm_request_seconds",
+    "Duration of the HTTP-requests by endpoint, until the (streamed) body is sent",
+    ["endpoint"],
+    buckets=latency_buckets,
+)
+cache_requests = prometheus_client.Counter(
+    "mdm_cache_requests_total",
+    "Cache-lookups by cache and result (hit/miss)",
+    ["cache", "result"],
+)
+model_version = prometheus_client.Gauge(
+    "mdm_model_version",
+    "Version-suffix of the loaded energy-models (energy-model-N)",
+)
+scraper_days = prometheus_client.Counter(
+    "mdm_scraper_days_total",
+    "Days scraped from entsoe by result (ok/failed)",
+    ["result"],
+)
+scraper_documents = prometheus_client.Counter(
+    "mdm_scraper_documents_total",
+    "Documents handed to the DB by result (inserted/duplicate)",
+    ["result"],
+)
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """Measure the duration of the block; observe it in the histogram and log it as one JSON-line"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        span_seconds.labels(name).observe(duration)
+        logger.info(json.dumps(dict(span=name, seconds=round(duration, 6), **fields)))
+
+
+def cache_lookup(cache, hit):
+    cache_requests.labels(cache, "hit" if hit else "miss").inc()
+
+
+def generate_latest():
+    """Return the metrics in the Prometheus text-format and their content-type"""
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST